@@ -4,22 +4,46 @@ Remote Agent - Self-updating agent with plugin system
 """
 
 import os
+import re
 import sys
 import time
 import json
 import hashlib
+import shutil
+import signal
 import socket
+import ipaddress
+import heapq
+import random
+import itertools
 import logging
+import mmap
+import tempfile
+import functools
 import threading
 import importlib.util
+import py_compile
 import urllib.request
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Final, Optional, Tuple, Union
 from datetime import datetime
 
 import websocket
 import requests
 import yaml
 
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is used instead
+    orjson = None
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader
+
 # Logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -40,34 +64,110 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE = os.path.join(SCRIPT_DIR, "config.yaml")
 PLUGINS_DIR = os.path.join(SCRIPT_DIR, "plugins")
 AGENT_FILE = os.path.join(SCRIPT_DIR, "agent.py")
+# Next to config.yaml rather than in a shared temp dir: the cached ID is the
+# agent's identity, so only the agent's own user may be able to write it
+MACHINE_ID_CACHE = os.path.join(SCRIPT_DIR, ".machine-id")
+
+# Public IP rarely changes; re-query api.ipify.org at most this often (seconds)
+PUBLIC_IP_TTL = 600
+# Until the first lookup succeeds, retry sooner than PUBLIC_IP_TTL (seconds)
+PUBLIC_IP_RETRY = 60
+
+# Upper bounds for jittered backoff (seconds)
+MAX_RECONNECT_DELAY = 60
+MAX_UPDATE_BACKOFF = 24 * 3600
+
+# "IOPlatformSerialNumber" = "XXXXXXXXXX"
+_IOREG_SERIAL_RE = re.compile(r'"IOPlatformSerialNumber"\s*=\s*"([^"]+)"')
 
+# VERSION = "x.y.z" line in downloaded agent code
+_VERSION_RE = re.compile(rb'^\s*VERSION\s*=\s*"([^"]+)"', re.MULTILINE)
 
+
+@functools.lru_cache(maxsize=1)
 def get_machine_id() -> str:
     """
     Get unique machine identifier.
     - macOS: Uses hardware serial number (unique per device)
     - Linux: Uses machine-id or generates from hardware info
     - Fallback: hostname
+
+    IDs that need a subprocess (ioreg/system_profiler/dmidecode) are cached
+    in MACHINE_ID_CACHE. /etc/machine-id is read fresh every start, so a
+    cloned VM that regenerated it doesn't keep the template's ID.
     """
+    machine_id = _read_linux_machine_id()
+    if machine_id:
+        return machine_id
+    
+    try:
+        with open(MACHINE_ID_CACHE, 'r') as f:
+            st = os.fstat(f.fileno())
+            # Ignore a cache someone else could have planted or edited
+            if st.st_uid == os.geteuid() and not st.st_mode & 0o022:
+                cached = f.read().strip()
+                if cached:
+                    return cached
+            else:
+                logger.warning(f"Ignoring machine ID cache with unsafe owner or mode: {MACHINE_ID_CACHE}")
+    except OSError:
+        pass
+    
+    machine_id = _detect_machine_id()
+    if machine_id:
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(MACHINE_ID_CACHE), prefix=".machine-id."
+            )
+            with os.fdopen(fd, 'w') as f:
+                f.write(machine_id)
+            os.replace(tmp_path, MACHINE_ID_CACHE)
+        except OSError as e:
+            logger.warning(f"Could not cache machine ID: {e}")
+        return machine_id
+    
+    # Final fallback: hostname (not cached, detection may succeed next start)
+    return socket.gethostname().lower().replace(' ', '-')
+
+
+def _read_linux_machine_id() -> Optional[str]:
+    """Read the Linux machine-id, or None if unavailable."""
+    if sys.platform != 'linux':
+        return None
+    machine_id_files = [
+        '/etc/machine-id',
+        '/var/lib/dbus/machine-id'
+    ]
+    for path in machine_id_files:
+        try:
+            with open(path, 'rb') as f:
+                machine_id = f.read(12).strip().decode('ascii', 'ignore')
+        except OSError:
+            continue
+        if machine_id:
+            return f"linux-{machine_id}"
+    return None
+
+
+def _detect_machine_id() -> Optional[str]:
+    """Detect the machine ID via a subprocess, or None if unavailable."""
     import subprocess
     
     try:
         if sys.platform == 'darwin':
-            # macOS - get hardware serial number
+            # macOS - get hardware serial number from the platform device
+            # node only (a few lines) instead of dumping the whole IORegistry
             result = subprocess.run(
-                ['ioreg', '-l'],
+                ['ioreg', '-rd1', '-c', 'IOPlatformExpertDevice'],
                 capture_output=True,
                 text=True,
                 timeout=5
             )
-            for line in result.stdout.split('\n'):
-                if 'IOPlatformSerialNumber' in line:
-                    # Extract serial: "IOPlatformSerialNumber" = "XXXXXXXXXX"
-                    serial = line.split('"')[-2]
-                    if serial and len(serial) > 5:
-                        return f"mac-{serial.lower()}"
+            match = _IOREG_SERIAL_RE.search(result.stdout)
+            if match and len(match.group(1)) > 5:
+                return f"mac-{match.group(1).lower()}"
             
-            # Fallback: try system_profiler
+            # Fallback (only if ioreg missed): try system_profiler
             result = subprocess.run(
                 ['system_profiler', 'SPHardwareDataType'],
                 capture_output=True,
@@ -81,18 +181,7 @@ def get_machine_id() -> str:
                         return f"mac-{serial.lower()}"
         
         elif sys.platform == 'linux':
-            # Linux - try machine-id first
-            machine_id_files = [
-                '/etc/machine-id',
-                '/var/lib/dbus/machine-id'
-            ]
-            for path in machine_id_files:
-                if os.path.exists(path):
-                    with open(path, 'r') as f:
-                        machine_id = f.read().strip()[:12]
-                        return f"linux-{machine_id}"
-            
-            # Fallback: try DMI serial
+            # Linux without a machine-id (see _read_linux_machine_id): DMI serial
             result = subprocess.run(
                 ['sudo', 'dmidecode', '-s', 'system-serial-number'],
                 capture_output=True,
@@ -105,8 +194,18 @@ def get_machine_id() -> str:
     except Exception as e:
         logger.warning(f"Could not get machine ID: {e}")
     
-    # Final fallback: hostname
-    return socket.gethostname().lower().replace(' ', '-')
+    return None
+
+
+def _file_sha256(path: str) -> str:
+    """SHA-256 hex digest of a file without reading it into one Python buffer"""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+        return h.hexdigest()
 
 
 def wait_for_network(
@@ -118,17 +217,29 @@ def wait_for_network(
     Wait for network connectivity before starting.
     Returns True when probe succeeds, False on timeout.
     """
-    start_time = time.time()
-    while time.time() - start_time < timeout:
+    # A zero/negative interval would never advance towards the deadline
+    check_interval = max(check_interval, 1)
+    
+    # Monotonic: the wall clock often jumps here, when NTP syncs at boot
+    start_time = time.monotonic()
+    deadline = start_time + timeout
+    next_probe = start_time
+    while True:
         try:
-            urllib.request.urlopen(check_url, timeout=3)
-            elapsed = int(time.time() - start_time)
+            with urllib.request.urlopen(check_url, timeout=3):
+                pass
+            elapsed = int(time.monotonic() - start_time)
             logger.info(f"Network available after {elapsed}s")
             return True
         except Exception:
-            elapsed = int(time.time() - start_time)
-            logger.info(f"Waiting for network... {elapsed}s")
-            time.sleep(check_interval)
+            now = time.monotonic()
+            logger.info(f"Waiting for network... {int(now - start_time)}s")
+        
+        # Probe on a fixed cadence rather than check_interval after each slow probe
+        next_probe += check_interval
+        if next_probe >= deadline or time.monotonic() >= deadline:
+            break
+        time.sleep(max(0.0, next_probe - time.monotonic()))
     logger.error("Network not available after timeout")
     return False
 
@@ -138,13 +249,33 @@ class AgentConfig:
     
     def __init__(self, config_file: str = CONFIG_FILE):
         self.config_file = config_file
+        self.reload()
+    
+    def reload(self):
+        """(Re)read the config file"""
         self.config = self.load_config()
+        # Dot-path -> leaf value, so hot-loop lookups are a single dict get
+        flat: Dict[str, Any] = {}
+        self._flatten('', self.config, flat)
+        self._flat = flat
+    
+    @staticmethod
+    def _flatten(prefix: str, data: Any, out: Dict[str, Any]) -> None:
+        """Flatten nested dicts into dot-path keys"""
+        if not isinstance(data, dict):
+            return
+        for k, v in data.items():
+            key = f"{prefix}.{k}" if prefix else str(k)
+            if isinstance(v, dict):
+                AgentConfig._flatten(key, v, out)
+            else:
+                out[key] = v
     
     def load_config(self) -> dict:
         """Load configuration from file"""
         try:
             with open(self.config_file, 'r') as f:
-                return yaml.safe_load(f)
+                return yaml.load(f, Loader=_YamlLoader)
         except FileNotFoundError:
             logger.error(f"Config file not found: {self.config_file}")
             return self.default_config()
@@ -157,7 +288,7 @@ class AgentConfig:
                 'graphql_url': 'https://your-worker.workers.dev/graphql',
             },
             'agent': {
-                'id': get_machine_id(),  # Uses serial number on macOS
+                'id': 'auto',  # Resolved to the serial number by Agent
                 'heartbeat_interval': 30,
                 'poll_interval': 60,
             },
@@ -175,6 +306,11 @@ class AgentConfig:
     
     def get(self, key: str, default=None):
         """Get config value by dot notation (e.g., 'server.ws_url')"""
+        if key in self._flat:
+            value = self._flat[key]
+            return value if value is not None else default
+        
+        # Section lookups (e.g. 'server') and keys not present at load time
         keys = key.split('.')
         value = self.config
         
@@ -193,6 +329,16 @@ class PluginManager:
     def __init__(self, plugins_dir: str = PLUGINS_DIR):
         self.plugins_dir = plugins_dir
         self.plugins: Dict[str, Any] = {}
+        # Loaded plugin names, rebuilt only when a plugin is added
+        self._plugin_names: Tuple[str, ...] = ()
+        # Plugin filename -> st_mtime_ns at last successful local load
+        self._plugin_mtimes: Dict[str, int] = {}
+        # Plugin name -> lock guarding handle() (plugins need not be reentrant)
+        self._plugin_locks: Dict[str, threading.Lock] = {}
+        # Plugin name -> sha256 of the loaded source (from <name>.sha256 sidecars)
+        self._checksums: Dict[str, str] = {}
+        # File path -> (st_mtime_ns, st_size, sha256) of the last hash computed
+        self._file_hashes: Dict[str, Tuple[int, int, str]] = {}
         
         logger.info(f"Plugin directory: {self.plugins_dir}")
         
@@ -211,16 +357,33 @@ class PluginManager:
             return
             
         try:
-            files = os.listdir(self.plugins_dir)
-            logger.info(f"Found files in plugins dir: {files}")
+            with os.scandir(self.plugins_dir) as it:
+                # is_file() uses the d_type from the directory read - no stat
+                entries = [
+                    e for e in it
+                    if e.name.endswith(".py") and e.name != "__init__.py" and e.is_file()
+                ]
+            logger.info(f"Found plugin files in plugins dir: {[e.name for e in entries]}")
             
-            for filename in files:
-                if not filename.endswith(".py") or filename == "__init__.py":
-                    continue
-
+            for entry in entries:
+                filename = entry.name
                 name = filename[:-3]
                 module_name = f"plugin_local_{name}"
-                plugin_path = os.path.join(self.plugins_dir, filename)
+                plugin_path = entry.path
+
+                try:
+                    mtime = entry.stat().st_mtime_ns
+                except OSError:
+                    mtime = None
+
+                # Unchanged since last load - keep the already loaded module
+                if (
+                    mtime is not None
+                    and self._plugin_mtimes.get(filename) == mtime
+                    and name in self.plugins
+                ):
+                    logger.info(f"Plugin unchanged, skipping reload: {name}")
+                    continue
 
                 logger.info(f"Loading plugin: {name} from {plugin_path}")
 
@@ -237,22 +400,79 @@ class PluginManager:
                         logger.error("Local plugin %s missing 'handle' function", name)
                         continue
 
-                    self.plugins[name] = module
+                    self._store_plugin(name, module)
+                    if mtime is not None:
+                        self._plugin_mtimes[filename] = mtime
+                    checksum = self._local_checksum(name, entry)
+                    if checksum:
+                        self._checksums[name] = checksum
+                    else:
+                        self._checksums.pop(name, None)
                     logger.info("✅ Local plugin loaded: %s", name)
                 except Exception as exc:  # noqa: BLE001
                     logger.error("Failed to load local plugin %s: %s", name, exc)
                     
-            logger.info(f"Total plugins loaded: {list(self.plugins.keys())}")
+            logger.info("Total plugins loaded: %s", self._plugin_names)
         except FileNotFoundError as e:
             logger.error(f"Plugin directory not found: {e}")
         except Exception as e:
             logger.error(f"Error loading plugins: {e}")
     
-    def load_plugin(self, name: str, code: str, checksum: str) -> bool:
-        """Load plugin from code string"""
+    def _sidecar_path(self, name: str) -> str:
+        return os.path.join(self.plugins_dir, f"{name}.sha256")
+    
+    def _local_checksum(self, name: str, entry: os.DirEntry) -> Optional[str]:
+        """
+        Checksum of a plugin file saved by load_plugin.
+        The "<sha256> <size> <mtime_ns>" sidecar is trusted while the file's
+        size and mtime still match; otherwise (file edited, or an older
+        sidecar without mtime) the file is re-hashed. None if there's no sidecar.
+        """
+        try:
+            with open(self._sidecar_path(name), 'r') as f:
+                fields = f.read().split()
+            st = entry.stat()
+            if (
+                len(fields) == 3
+                and int(fields[1]) == st.st_size
+                and int(fields[2]) == st.st_mtime_ns
+            ):
+                # Seed the stat-keyed cache too, so the first sync_plugins
+                # after a restart doesn't re-hash the file either
+                self._file_hashes[entry.path] = (st.st_mtime_ns, st.st_size, fields[0])
+                return fields[0]
+            return self._disk_checksum(entry.path, st)
+        except (OSError, ValueError):
+            return None
+    
+    def _disk_checksum(self, path: str, st: Optional[os.stat_result] = None) -> str:
+        """sha256 of a file, re-hashed only when its mtime or size changed"""
+        if st is None:
+            st = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = _file_sha256(path)
+        self._file_hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+    
+    def load_plugin(self, name: str, code: Union[str, bytes], checksum: str) -> bool:
+        """Load plugin from source code (str or UTF-8 bytes)"""
         try:
-            # Verify checksum
-            actual_checksum = hashlib.sha256(code.encode()).hexdigest()
+            # Same source is already loaded and saved - nothing to verify, exec or write
+            plugin_file = os.path.join(self.plugins_dir, f"{name}.py")
+            if name in self.plugins and self._checksums.get(name) == checksum:
+                try:
+                    on_disk = self._disk_checksum(plugin_file)
+                except OSError:
+                    on_disk = None
+                if on_disk == checksum:
+                    logger.info(f"Plugin {name} unchanged, skipping reload")
+                    return True
+            
+            # Verify checksum (hash the bytes we will write, encoding at most once)
+            code_bytes = code.encode('utf-8') if isinstance(code, str) else code
+            actual_checksum = hashlib.sha256(code_bytes).hexdigest()
             if actual_checksum != checksum:
                 logger.error(f"Plugin {name} checksum mismatch!")
                 return False
@@ -263,7 +483,7 @@ class PluginManager:
             module = importlib.util.module_from_spec(spec)
             
             # Execute code
-            exec(code, module.__dict__)
+            exec(compile(code_bytes, plugin_file, 'exec'), module.__dict__)
             
             # Verify plugin has required methods
             if not hasattr(module, 'handle'):
@@ -271,13 +491,27 @@ class PluginManager:
                 return False
             
             # Store plugin
-            self.plugins[name] = module
+            self._store_plugin(name, module)
             logger.info(f"✅ Plugin loaded: {name}")
             
             # Save to disk for persistence
-            plugin_file = os.path.join(self.plugins_dir, f"{name}.py")
-            with open(plugin_file, 'w') as f:
-                f.write(code)
+            with open(plugin_file, 'wb') as f:
+                f.write(code_bytes)
+            
+            # Pre-write __pycache__ bytecode so the next startup skips compiling
+            py_compile.compile(
+                plugin_file,
+                cfile=importlib.util.cache_from_source(plugin_file),
+                doraise=False,
+            )
+            
+            # Record the verified checksum so later syncs/restarts can skip this plugin
+            st = os.stat(plugin_file)
+            with open(self._sidecar_path(name), 'w') as f:
+                f.write(f"{checksum} {st.st_size} {st.st_mtime_ns}\n")
+            self._checksums[name] = checksum
+            self._plugin_mtimes[f"{name}.py"] = st.st_mtime_ns
+            self._file_hashes[plugin_file] = (st.st_mtime_ns, st.st_size, checksum)
             
             return True
             
@@ -285,15 +519,21 @@ class PluginManager:
             logger.error(f"Failed to load plugin {name}: {e}")
             return False
     
+    def _store_plugin(self, name: str, module: Any) -> None:
+        """Register a loaded plugin module"""
+        self.plugins[name] = module
+        if name not in self._plugin_names:
+            self._plugin_names = tuple(self.plugins)
+    
     def execute_plugin(self, name: str, args: dict) -> dict:
         """Execute plugin command"""
-        logger.info(f"Executing plugin: {name} with args: {args}")
-        logger.info(f"Available plugins: {list(self.plugins.keys())}")
+        logger.info("Executing plugin: %s with args: %s", name, args)
+        logger.info("Available plugins: %s", self._plugin_names)
         
         plugin = self.plugins.get(name)
         
         if not plugin:
-            error_msg = f"Plugin '{name}' not found. Available: {list(self.plugins.keys())}"
+            error_msg = f"Plugin '{name}' not found. Available: {list(self._plugin_names)}"
             logger.error(error_msg)
             return {
                 "success": False,
@@ -301,8 +541,14 @@ class PluginManager:
             }
         
         try:
-            result = plugin.handle(args)
-            logger.info(f"Plugin {name} result: {result}")
+            # "parallel" commands may overlap; plugins that set
+            # REENTRANT = False get their calls serialized
+            if getattr(plugin, 'REENTRANT', True):
+                result = plugin.handle(args)
+            else:
+                with self._plugin_locks.setdefault(name, threading.Lock()):
+                    result = plugin.handle(args)
+            logger.info("Plugin %s result: %s", name, result)
             
             # Ensure result has success field
             if isinstance(result, dict):
@@ -323,45 +569,152 @@ class PluginManager:
     
     def list_plugins(self) -> list:
         """List loaded plugins"""
-        return list(self.plugins.keys())
+        return list(self._plugin_names)
+
+
+# GraphQL documents used by GraphQLClient
+_QUERY_PENDING: Final[str] = """
+query GetCommands($agentId: String!, $limit: Int) {
+  getPendingCommands(agentId: $agentId, limit: $limit) {
+    id
+    command
+    priority
+  }
+}
+"""
+
+_MUT_UPDATE_STATUS: Final[str] = """
+mutation UpdateStatus($id: Int!, $status: String!, $result: JSON) {
+  updateCommandStatus(id: $id, status: $status, result: $result) {
+    id
+  }
+}
+"""
+
+_MUT_HEARTBEAT: Final[str] = """
+mutation Heartbeat(
+  $agentId: String!
+  $version: String
+  $status: String
+  $ipAddress: String
+  $hostname: String
+) {
+  reportHeartbeat(
+    agentId: $agentId
+    version: $version
+    status: $status
+    ipAddress: $ipAddress
+    hostname: $hostname
+  )
+}
+"""
+
+_QUERY_PLUGINS: Final[str] = """
+query GetPlugins {
+  getPlugins {
+    name
+    version
+    code
+    checksum
+  }
+}
+"""
+
+_QUERY_AGENT_UPDATE: Final[str] = """
+query GetAgentUpdate($currentVersion: String!) {
+  getAgentUpdate(currentVersion: $currentVersion) {
+    version
+    code
+    checksum
+    releaseNotes
+  }
+}
+"""
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes, via orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. namedtuples - let stdlib json handle them
+    return json.dumps(obj).encode()
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON from str or bytes, via orjson when installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Reply to server pings, serialized once
+_WS_PONG = _json_dumps({"type": "pong"}).decode()
+
+
+@functools.lru_cache(maxsize=16)
+def _request_prefix(query_str: str) -> bytes:
+    """
+    Constant head of a GraphQL request body, built once per document:
+    b'{"query":"<minified document>","variables":'. Only the variables
+    are serialized per call.
+    """
+    minified = " ".join(query_str.split())
+    return b'{"query":' + json.dumps(minified).encode() + b',"variables":'
+
+
+# Tail of the request body when there are no variables: {} plus the closing brace
+_EMPTY_VARIABLES_TAIL: Final[bytes] = b'{}}'
+
+
+def _make_session() -> requests.Session:
+    """Pooled keep-alive HTTP session with retries on connection errors"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.3),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
 
 class GraphQLClient:
     """GraphQL API client"""
     
-    def __init__(self, url: str):
+    def __init__(self, url: str, session: Optional[requests.Session] = None):
         self.url = url
+        # Shared with the Agent so GraphQL, IP lookups and downloads reuse connections
+        self.session = session or _make_session()
+        # (public IP, time.monotonic() of last lookup)
+        self._ip_cache: Tuple[Optional[str], float] = (None, 0.0)
+        # Refreshed together with the public IP
+        self._hostname = socket.gethostname()
     
     def query(self, query_str: str, variables: Optional[dict] = None) -> dict:
         """Execute GraphQL query"""
         try:
-            response = requests.post(
+            if variables:
+                body = b''.join((_request_prefix(query_str), _json_dumps(variables), b'}'))
+            else:
+                body = _request_prefix(query_str) + _EMPTY_VARIABLES_TAIL
+            response = self.session.post(
                 self.url,
-                json={
-                    "query": query_str,
-                    "variables": variables or {}
-                },
+                data=body,
                 headers={"Content-Type": "application/json"},
                 timeout=10
             )
             response.raise_for_status()
-            return response.json()
+            return _json_loads(response.content)
         except Exception as e:
             logger.error(f"GraphQL request failed: {e}")
             return {"errors": [{"message": str(e)}]}
     
     def get_pending_commands(self, agent_id: str, limit: int = 10) -> list:
         """Get pending commands for agent"""
-        query = """
-        query GetCommands($agentId: String!, $limit: Int) {
-          getPendingCommands(agentId: $agentId, limit: $limit) {
-            id
-            command
-            priority
-          }
-        }
-        """
-        result = self.query(query, {"agentId": agent_id, "limit": limit})
+        result = self.query(_QUERY_PENDING, {"agentId": agent_id, "limit": limit})
         
         if "errors" in result:
             return []
@@ -370,14 +723,7 @@ class GraphQLClient:
     
     def update_command_status(self, cmd_id: int, status: str, result: dict = None):
         """Update command status"""
-        mutation = """
-        mutation UpdateStatus($id: Int!, $status: String!, $result: JSON) {
-          updateCommandStatus(id: $id, status: $status, result: $result) {
-            id
-          }
-        }
-        """
-        self.query(mutation, {
+        self.query(_MUT_UPDATE_STATUS, {
             "id": cmd_id,
             "status": status,
             "result": result
@@ -385,51 +731,39 @@ class GraphQLClient:
     
     def report_heartbeat(self, agent_id: str, version: str, status: str = "online"):
         """Send heartbeat"""
-        mutation = """
-        mutation Heartbeat(
-          $agentId: String!
-          $version: String
-          $status: String
-          $ipAddress: String
-          $hostname: String
-        ) {
-          reportHeartbeat(
-            agentId: $agentId
-            version: $version
-            status: $status
-            ipAddress: $ipAddress
-            hostname: $hostname
-          )
-        }
-        """
+        ip = self.get_public_ip()
         
-        # Get IP address
-        try:
-            ip = requests.get('https://api.ipify.org', timeout=5).text
-        except:
-            ip = None
-        
-        self.query(mutation, {
+        self.query(_MUT_HEARTBEAT, {
             "agentId": agent_id,
             "version": version,
             "status": status,
             "ipAddress": ip,
-            "hostname": socket.gethostname()
+            "hostname": self._hostname
         })
     
+    def get_public_ip(self) -> Optional[str]:
+        """Public IP address, refreshed at most every PUBLIC_IP_TTL seconds"""
+        ip, fetched_at = self._ip_cache
+        now = time.monotonic()
+        if fetched_at and now - fetched_at < PUBLIC_IP_TTL:
+            return ip
+        
+        self._hostname = socket.gethostname()
+        try:
+            response = self.session.get('https://api.ipify.org', timeout=5)
+            response.raise_for_status()
+            # Don't cache an error page as the address for a whole TTL
+            ip = str(ipaddress.ip_address(response.text.strip()))
+        except Exception:
+            if ip is None:
+                # Nothing cached yet: try again after PUBLIC_IP_RETRY, not PUBLIC_IP_TTL
+                now -= PUBLIC_IP_TTL - PUBLIC_IP_RETRY
+        self._ip_cache = (ip, now)
+        return ip
+    
     def sync_plugins(self) -> list:
         """Get all plugins from server"""
-        query = """
-        query GetPlugins {
-          getPlugins {
-            name
-            version
-            code
-            checksum
-          }
-        }
-        """
-        result = self.query(query)
+        result = self.query(_QUERY_PLUGINS)
         
         if "errors" in result:
             return []
@@ -438,17 +772,7 @@ class GraphQLClient:
     
     def get_agent_update(self) -> Optional[dict]:
         """Check for agent updates from server"""
-        query = """
-        query GetAgentUpdate($currentVersion: String!) {
-          getAgentUpdate(currentVersion: $currentVersion) {
-            version
-            code
-            checksum
-            releaseNotes
-          }
-        }
-        """
-        result = self.query(query, {"currentVersion": VERSION})
+        result = self.query(_QUERY_AGENT_UPDATE, {"currentVersion": VERSION})
         
         if "errors" in result:
             return None
@@ -461,6 +785,7 @@ class Agent:
     
     def __init__(self, config_file: str = CONFIG_FILE):
         self.config = AgentConfig(config_file)
+        self._bind_config()
         
         # Get agent ID - use serial number if "auto" or empty
         configured_id = self.config.get('agent.id')
@@ -473,15 +798,61 @@ class Agent:
         self.version = VERSION
         
         # Components
-        self.graphql = GraphQLClient(self.config.get('server.graphql_url'))
+        self.http = _make_session()
+        self.graphql = GraphQLClient(self._graphql_url, session=self.http)
         self.plugin_manager = PluginManager()
+        # Commands run one at a time in the order they were queued, like the
+        # server's priority order; only those marked "parallel" use the pool
+        self._cmd_queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cmd")
+        self._exec_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="worker")
         
         # WebSocket
         self.ws = None
         self.ws_connected = False
+        self._ws_handlers = {
+            'new_command': self._on_ws_new_command,
+            'sync_plugins': self._on_ws_sync_plugins,
+            'ping': self._on_ws_ping,
+        }
+        
+        # Command type -> handler(command) -> result dict
+        self._cmd_handlers = {
+            'ping': self._cmd_ping,
+            'sync_plugins': self._cmd_sync_plugins,
+            'reload_plugins': self._cmd_reload_plugins,
+            'list_plugins': self._cmd_list_plugins,
+            'get_status': self._cmd_get_status,
+            'self_update': self._cmd_self_update,
+            'check_update': self._cmd_check_update,
+            'update_plugin': self._cmd_update_plugin,
+            'restart': self._cmd_restart,
+            'plugin_command': self._cmd_plugin,
+            'plugin': self._cmd_plugin,
+        }
         
         # State
         self.running = True
+        # Set by stop(); waits on it return immediately on shutdown
+        self._stop_event = threading.Event()
+        self._update_applied = False
+        self._update_lock = threading.Lock()
+        
+        # Reconnect / retry backoff state (seconds)
+        self._reconnect_delay = 1
+        self._update_retry_delay = self._update_interval
+        
+        # Scheduler: heap of (deadline, seq, interval, callback)
+        self._tasks: list = []
+        self._task_seq = itertools.count()
+        self._tasks_lock = threading.Lock()
+        self._wake = threading.Event()
+        # Tasks that may block for long are run on _exec_pool instead
+        self._blocking_tasks: set = set()
+        # Command IDs queued or running, so a poll doesn't pick them up twice
+        self._inflight: set = set()
+        self._inflight_lock = threading.Lock()
+        # Current fallback polling delay (see poll_if_disconnected)
+        self._poll_backoff = 1
         
         logger.info("=" * 60)
         logger.info(f"🤖 Agent v{self.version} initialized")
@@ -490,6 +861,48 @@ class Agent:
         logger.info(f"   Notes: {RELEASE_NOTES}")
         logger.info("=" * 60)
     
+    def _bind_config(self):
+        """Copy the settings used by periodic tasks into attributes"""
+        self._graphql_url = self.config.get('server.graphql_url')
+        self._ws_url = self.config.get('server.ws_url')
+        self._heartbeat_interval = self.config.get('agent.heartbeat_interval', 30)
+        self._poll_interval = self.config.get('agent.poll_interval', 60)
+        self._plugin_auto_sync = self.config.get('plugins.auto_sync', True)
+        self._plugin_sync_interval = self.config.get('plugins.sync_interval', 300)
+        self._auto_update = self.config.get('updates.auto_update', False)
+        self._update_interval = self.config.get('updates.check_interval', 3600)  # Default 1 hour
+        self._update_url = self.config.get('updates.update_url', '')
+        # Scheduled callback -> current interval; the scheduler reads this
+        # each time it re-queues a task, so reloads apply mid-run too
+        self._task_intervals = {
+            self.send_heartbeat: self._heartbeat_interval,
+            self.poll_if_disconnected: self._poll_interval,
+            self.periodic_plugin_sync: self._plugin_sync_interval,
+            self.check_for_updates: self._update_interval,
+        }
+    
+    def reload_config(self, *_):
+        """Re-read config.yaml and apply new intervals (also the SIGHUP handler)"""
+        logger.info(f"Reloading config from {self.config.config_file}")
+        try:
+            self.config.reload()
+        except Exception as e:
+            # Runs in a signal handler on the main thread: never let a typo kill the agent
+            logger.error(f"Config reload failed, keeping the current config: {e}")
+            return
+        self._bind_config()
+        
+        # The WebSocket URL applies from the next reconnect; the GraphQL URL
+        # and enabling/disabling tasks still need a restart
+        intervals = self._task_intervals
+        with self._tasks_lock:
+            self._tasks = [
+                (deadline, seq, intervals.get(cb, interval), cb)
+                for deadline, seq, interval, cb in self._tasks
+            ]
+            heapq.heapify(self._tasks)
+        self._wake.set()
+    
     def sync_plugins(self):
         """Sync plugins from server"""
         logger.info("Syncing plugins from server...")
@@ -507,7 +920,8 @@ class Agent:
         else:
             logger.info("No plugins from server (using local plugins only)")
         
-        logger.info(f"All available plugins: {self.plugin_manager.list_plugins()}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"All available plugins: {self.plugin_manager.list_plugins()}")
     
     def self_update(self, update_url: str = None, force: bool = False) -> dict:
         """
@@ -520,6 +934,17 @@ class Agent:
         Returns:
             dict with success status and message
         """
+        # A self_update command can overlap the scheduled update check
+        if not self._update_lock.acquire(blocking=False):
+            logger.warning("Self-update already in progress, skipping")
+            return {"success": False, "error": "Update already in progress"}
+        try:
+            return self._self_update(update_url, force)
+        finally:
+            self._update_lock.release()
+    
+    def _self_update(self, update_url: Optional[str], force: bool) -> dict:
+        """self_update body; called with _update_lock held"""
         import subprocess
         
         logger.info("=" * 60)
@@ -528,29 +953,51 @@ class Agent:
         logger.info(f"   Release Date: {RELEASE_DATE}")
         logger.info("=" * 60)
         
+        # New code is staged in a unique temp file next to agent.py and
+        # atomically swapped in, so a crash mid-write never leaves a
+        # truncated agent.py behind
+        tmp_file = None
+        
         try:
+            fd, tmp_file = tempfile.mkstemp(
+                dir=os.path.dirname(AGENT_FILE), prefix=".agent.py.", suffix=".tmp"
+            )
+            os.close(fd)
+            
             new_code = None
             new_version = None
-            checksum = None
+            checksum = None  # expected checksum, when the source provides one
+            new_checksum = None  # checksum of new_code, computed once
             
             # Method 1: Update from direct URL
             if update_url:
                 logger.info(f"📥 Downloading from URL: {update_url}")
-                response = requests.get(update_url, timeout=30)
-                response.raise_for_status()
-                new_code = response.text
-                logger.info(f"   Downloaded {len(new_code)} bytes")
+                # Stream the download straight to the temp file, hashing as it goes
+                hasher = hashlib.sha256()
+                size = 0
+                with self.http.get(update_url, timeout=30, stream=True) as response:
+                    response.raise_for_status()
+                    with open(tmp_file, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=65536):
+                            hasher.update(chunk)
+                            f.write(chunk)
+                            size += len(chunk)
+                        f.flush()
+                        os.fsync(f.fileno())
+                new_checksum = hasher.hexdigest()
+                logger.info(f"   Downloaded {size} bytes")
+                if not size:
+                    logger.error("❌ No update code received")
+                    return {"success": False, "error": "No update code received"}
                 
                 # Extract version from downloaded code
-                new_version = "unknown"
-                for line in new_code.split('\n'):
-                    if line.strip().startswith('VERSION = '):
-                        new_version = line.split('"')[1]
-                        break
+                with open(tmp_file, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    match = _VERSION_RE.search(mm)
+                    new_version = match.group(1).decode() if match else "unknown"
                 
-                checksum = hashlib.sha256(new_code.encode()).hexdigest()
                 logger.info(f"   Detected version: {new_version}")
-                logger.info(f"   Checksum: {checksum[:16]}...")
+                logger.info(f"   Checksum: {new_checksum[:16]}...")
             
             # Method 2: Update from GraphQL server
             else:
@@ -579,38 +1026,51 @@ class Agent:
                         "message": f"Already at latest version {self.version}",
                         "current_version": self.version
                     }
-            
-            if not new_code:
-                logger.error("❌ No update code received")
-                return {"success": False, "error": "No update code received"}
-            
-            # Verify checksum if provided
-            if checksum:
-                actual_checksum = hashlib.sha256(new_code.encode()).hexdigest()
-                if actual_checksum != checksum:
-                    logger.error("❌ Checksum mismatch - update rejected!")
-                    logger.error(f"   Expected: {checksum[:16]}...")
-                    logger.error(f"   Got:      {actual_checksum[:16]}...")
-                    return {
-                        "success": False,
-                        "error": "Checksum mismatch - update rejected"
-                    }
-                logger.info("✓ Checksum verified")
+                
+                if not new_code:
+                    logger.error("❌ No update code received")
+                    return {"success": False, "error": "No update code received"}
+                
+                new_code = new_code.encode('utf-8')
+                
+                # Verify checksum if provided
+                if checksum:
+                    new_checksum = hashlib.sha256(new_code).hexdigest()
+                    if new_checksum != checksum:
+                        logger.error("❌ Checksum mismatch - update rejected!")
+                        logger.error(f"   Expected: {checksum[:16]}...")
+                        logger.error(f"   Got:      {new_checksum[:16]}...")
+                        return {
+                            "success": False,
+                            "error": "Checksum mismatch - update rejected"
+                        }
+                    logger.info("✓ Checksum verified")
+                
+                with open(tmp_file, 'wb') as f:
+                    f.write(new_code)
+                    f.flush()
+                    os.fsync(f.fileno())
             
             # Backup current agent
             backup_file = f"{AGENT_FILE}.backup"
             logger.info(f"💾 Creating backup: {backup_file}")
             
-            with open(AGENT_FILE, 'r') as f:
-                current_code = f.read()
-            with open(backup_file, 'w') as f:
-                f.write(current_code)
+            # Hard-link the current file as the backup: a metadata-only operation.
+            # The os.replace below swaps a new inode in, leaving the backup intact
+            try:
+                os.remove(backup_file)
+            except FileNotFoundError:
+                pass
+            try:
+                os.link(AGENT_FILE, backup_file)
+            except OSError:
+                # No hard links here (e.g. some network/FAT mounts): kernel-side copy
+                shutil.copy2(AGENT_FILE, backup_file)
             logger.info("   Backup created successfully")
             
-            # Write new code
             logger.info(f"📝 Writing new agent code to: {AGENT_FILE}")
-            with open(AGENT_FILE, 'w') as f:
-                f.write(new_code)
+            shutil.copymode(AGENT_FILE, tmp_file)
+            os.replace(tmp_file, AGENT_FILE)
             logger.info("   New code written successfully")
             
             logger.info("=" * 60)
@@ -655,6 +1115,13 @@ class Agent:
         except Exception as e:
             logger.error(f"Self-update failed: {e}")
             return {"success": False, "error": str(e)}
+        finally:
+            # Only left behind if the update was rejected or failed
+            if tmp_file:
+                try:
+                    os.remove(tmp_file)
+                except FileNotFoundError:
+                    pass
     
     def update_plugin_from_url(self, name: str, url: str) -> dict:
         """
@@ -669,11 +1136,11 @@ class Agent:
         """
         try:
             logger.info(f"Downloading plugin {name} from: {url}")
-            response = requests.get(url, timeout=30)
+            response = self.http.get(url, timeout=30)
             response.raise_for_status()
             
-            code = response.text
-            checksum = hashlib.sha256(code.encode()).hexdigest()
+            code = response.content
+            checksum = hashlib.sha256(code).hexdigest()
             
             success = self.plugin_manager.load_plugin(name, code, checksum)
             
@@ -690,15 +1157,113 @@ class Agent:
             logger.error(f"Plugin update failed: {e}")
             return {"success": False, "error": str(e)}
     
+    # Built-in commands (dispatched through self._cmd_handlers)
+    
+    def _cmd_ping(self, command: dict) -> dict:
+        return {"message": "pong", "timestamp": datetime.now().isoformat()}
+    
+    def _cmd_sync_plugins(self, command: dict) -> dict:
+        self.sync_plugins()
+        return {"success": True, "plugins": self.plugin_manager.list_plugins()}
+    
+    def _cmd_reload_plugins(self, command: dict) -> dict:
+        # Reload local plugins
+        self.plugin_manager.load_local_plugins()
+        return {"success": True, "plugins": self.plugin_manager.list_plugins()}
+    
+    def _cmd_list_plugins(self, command: dict) -> dict:
+        return {"success": True, "plugins": self.plugin_manager.list_plugins()}
+    
+    def _cmd_get_status(self, command: dict) -> dict:
+        # Determine if ID was auto-detected or configured
+        configured_id = self.config.get('agent.id')
+        id_source = "auto-detected (serial)" if not configured_id or configured_id.lower() == 'auto' else "configured"
+        
+        return {
+            "success": True,
+            "agent_id": self.agent_id,
+            "id_source": id_source,
+            "version": self.version,
+            "release_date": RELEASE_DATE,
+            "release_notes": RELEASE_NOTES,
+            "uptime": time.time(),
+            "plugins": self.plugin_manager.list_plugins(),
+            "ws_connected": self.ws_connected,
+            "platform": sys.platform
+        }
+    
+    # Self-update commands
+    
+    def _cmd_self_update(self, command: dict) -> dict:
+        update_url = command.get('url')  # Optional direct URL
+        force = command.get('force', False)
+        return self.self_update(update_url=update_url, force=force)
+    
+    def _cmd_check_update(self, command: dict) -> dict:
+        update_info = self.graphql.get_agent_update()
+        if update_info:
+            return {
+                "success": True,
+                "update_available": True,
+                "current_version": self.version,
+                "new_version": update_info.get('version'),
+                "release_notes": update_info.get('releaseNotes')
+            }
+        return {
+            "success": True,
+            "update_available": False,
+            "current_version": self.version
+        }
+    
+    def _cmd_update_plugin(self, command: dict) -> dict:
+        plugin_name = command.get('name')
+        plugin_url = command.get('url')
+        if not plugin_name or not plugin_url:
+            return {
+                "success": False,
+                "error": "Missing 'name' or 'url' in command"
+            }
+        return self.update_plugin_from_url(plugin_name, plugin_url)
+    
+    def _cmd_restart(self, command: dict) -> dict:
+        # Schedule restart
+        def do_restart():
+            time.sleep(2)
+            if sys.platform == 'darwin':
+                import subprocess
+                plist = os.path.expanduser(
+                    '~/Library/LaunchAgents/com.remote-agent.plist'
+                )
+                subprocess.run(['launchctl', 'unload', plist], check=False)
+                subprocess.run(['launchctl', 'load', plist], check=False)
+            else:
+                import subprocess
+                subprocess.run(
+                    ['sudo', 'systemctl', 'restart', 'remote-agent'],
+                    check=False
+                )
+        threading.Thread(target=do_restart, daemon=True).start()
+        return {"success": True, "message": "Agent restarting..."}
+    
+    # Plugin commands (accept both 'plugin_command' and 'plugin')
+    
+    def _cmd_plugin(self, command: dict) -> dict:
+        plugin_name = command.get('plugin')
+        args = command.get('args', {})
+        
+        if not plugin_name:
+            return {"success": False, "error": "Missing 'plugin' field in command"}
+        return self.plugin_manager.execute_plugin(plugin_name, args)
+    
     def execute_command(self, cmd: dict):
         """Execute a command"""
         cmd_id = cmd['id']
         command = cmd['command']
 
         # Support backends that store JSON as string
-        if isinstance(command, str):
+        if isinstance(command, (str, bytes)):
             try:
-                command = json.loads(command)
+                command = _json_loads(command)
             except Exception as exc:  # noqa: BLE001
                 logger.error("Command %s has invalid JSON payload: %s", cmd_id, exc)
                 self.graphql.update_command_status(cmd_id, 'failed', {
@@ -714,108 +1279,11 @@ class Agent:
         self.graphql.update_command_status(cmd_id, 'processing')
         
         try:
-            result = None
-            
-            # Built-in commands
-            if cmd_type == 'ping':
-                result = {"message": "pong", "timestamp": datetime.now().isoformat()}
-            
-            elif cmd_type == 'sync_plugins':
-                self.sync_plugins()
-                result = {"success": True, "plugins": self.plugin_manager.list_plugins()}
-            
-            elif cmd_type == 'reload_plugins':
-                # Reload local plugins
-                self.plugin_manager.load_local_plugins()
-                result = {"success": True, "plugins": self.plugin_manager.list_plugins()}
-            
-            elif cmd_type == 'list_plugins':
-                result = {"success": True, "plugins": self.plugin_manager.list_plugins()}
-            
-            elif cmd_type == 'get_status':
-                # Determine if ID was auto-detected or configured
-                configured_id = self.config.get('agent.id')
-                id_source = "auto-detected (serial)" if not configured_id or configured_id.lower() == 'auto' else "configured"
-                
-                result = {
-                    "success": True,
-                    "agent_id": self.agent_id,
-                    "id_source": id_source,
-                    "version": self.version,
-                    "release_date": RELEASE_DATE,
-                    "release_notes": RELEASE_NOTES,
-                    "uptime": time.time(),
-                    "plugins": self.plugin_manager.list_plugins(),
-                    "ws_connected": self.ws_connected,
-                    "platform": sys.platform
-                }
-            
-            # Self-update commands
-            elif cmd_type == 'self_update':
-                update_url = command.get('url')  # Optional direct URL
-                force = command.get('force', False)
-                result = self.self_update(update_url=update_url, force=force)
-            
-            elif cmd_type == 'check_update':
-                update_info = self.graphql.get_agent_update()
-                if update_info:
-                    result = {
-                        "success": True,
-                        "update_available": True,
-                        "current_version": self.version,
-                        "new_version": update_info.get('version'),
-                        "release_notes": update_info.get('releaseNotes')
-                    }
-                else:
-                    result = {
-                        "success": True,
-                        "update_available": False,
-                        "current_version": self.version
-                    }
-            
-            elif cmd_type == 'update_plugin':
-                plugin_name = command.get('name')
-                plugin_url = command.get('url')
-                if not plugin_name or not plugin_url:
-                    result = {
-                        "success": False,
-                        "error": "Missing 'name' or 'url' in command"
-                    }
-                else:
-                    result = self.update_plugin_from_url(plugin_name, plugin_url)
-            
-            elif cmd_type == 'restart':
-                result = {"success": True, "message": "Agent restarting..."}
-                # Schedule restart
-                def do_restart():
-                    time.sleep(2)
-                    if sys.platform == 'darwin':
-                        import subprocess
-                        plist = os.path.expanduser(
-                            '~/Library/LaunchAgents/com.remote-agent.plist'
-                        )
-                        subprocess.run(['launchctl', 'unload', plist], check=False)
-                        subprocess.run(['launchctl', 'load', plist], check=False)
-                    else:
-                        import subprocess
-                        subprocess.run(
-                            ['sudo', 'systemctl', 'restart', 'remote-agent'],
-                            check=False
-                        )
-                threading.Thread(target=do_restart, daemon=True).start()
-            
-            # Plugin commands (accept both 'plugin_command' and 'plugin')
-            elif cmd_type in ('plugin_command', 'plugin'):
-                plugin_name = command.get('plugin')
-                args = command.get('args', {})
-                
-                if not plugin_name:
-                    result = {"success": False, "error": "Missing 'plugin' field in command"}
-                else:
-                    result = self.plugin_manager.execute_plugin(plugin_name, args)
-            
-            else:
+            handler = self._cmd_handlers.get(cmd_type)
+            if handler is None:
                 result = {"error": f"Unknown command type: {cmd_type}"}
+            else:
+                result = handler(command)
             
             # Update status to done
             status = 'done' if result.get('success', True) else 'failed'
@@ -829,167 +1297,312 @@ class Agent:
                 "error": str(e)
             })
     
-    def poll_commands(self):
-        """Poll for pending commands (fallback when WebSocket is down)"""
-        commands = self.graphql.get_pending_commands(self.agent_id)
-        
-        for cmd in commands:
-            self.execute_command(cmd)
-    
-    def heartbeat_loop(self):
-        """Send periodic heartbeat"""
-        interval = self.config.get('agent.heartbeat_interval', 30)
+    def submit_command(self, cmd: dict) -> bool:
+        """
+        Queue a command for execution unless it is already queued or running.
+        Commands run in order; a payload with "parallel": true may run
+        alongside others on the worker pool.
+        """
+        cmd_id = cmd['id']
+        with self._inflight_lock:
+            if cmd_id in self._inflight:
+                return False
+            self._inflight.add(cmd_id)
         
-        while self.running:
+        command = cmd.get('command')
+        if isinstance(command, (str, bytes)):
             try:
-                self.graphql.report_heartbeat(
-                    self.agent_id,
-                    self.version,
-                    'online' if self.ws_connected else 'polling'
-                )
-            except Exception as e:
-                logger.error(f"Heartbeat failed: {e}")
-            
-            time.sleep(interval)
-    
-    def polling_loop(self):
-        """Fallback polling loop"""
-        interval = self.config.get('agent.poll_interval', 60)
+                command = _json_loads(command)
+                cmd = {**cmd, 'command': command}
+            except Exception:  # noqa: BLE001 - execute_command reports it
+                pass
+        parallel = isinstance(command, dict) and command.get('parallel') is True
+        executor = self._exec_pool if parallel else self._cmd_queue
         
-        while self.running:
-            if not self.ws_connected:
-                try:
-                    self.poll_commands()
-                except Exception as e:
-                    logger.error(f"Polling failed: {e}")
-            
-            time.sleep(interval)
+        future = executor.submit(self._run_logged, self.execute_command, cmd)
+        future.add_done_callback(lambda _: self._command_done(cmd_id))
+        return True
     
-    def plugin_sync_loop(self):
-        """Periodic plugin sync"""
-        if not self.config.get('plugins.auto_sync', True):
-            return
+    def _command_done(self, cmd_id):
+        with self._inflight_lock:
+            self._inflight.discard(cmd_id)
+    
+    def poll_commands(self) -> int:
+        """
+        Poll for pending commands (fallback when WebSocket is down).
+        Commands run in the background; returns how many were newly queued.
+        """
+        commands = self.graphql.get_pending_commands(self.agent_id)
+        return sum(self.submit_command(cmd) for cmd in commands)
+    
+    def send_heartbeat(self):
+        """Send one heartbeat"""
+        try:
+            self.graphql.report_heartbeat(
+                self.agent_id,
+                self.version,
+                'online' if self.ws_connected else 'polling'
+            )
+        except Exception as e:
+            logger.error(f"Heartbeat failed: {e}")
+    
+    def poll_if_disconnected(self) -> float:
+        """
+        Fallback poll, only while the WebSocket is down.
+        Returns the delay until the next poll: starts at 1s after a disconnect
+        and doubles up to agent.poll_interval while nothing is pending.
+        """
+        max_interval = self._poll_interval
+        if self.ws_connected:
+            self._poll_backoff = 1
+            return max_interval
         
-        interval = self.config.get('plugins.sync_interval', 300)
+        try:
+            if self.poll_commands():
+                self._poll_backoff = 1
+                return self._poll_backoff
+        except Exception as e:
+            logger.error(f"Polling failed: {e}")
         
+        self._poll_backoff = min(max_interval, self._poll_backoff * 2)
+        return self._poll_backoff
+    
+    def periodic_plugin_sync(self):
+        """Periodic plugin sync"""
+        try:
+            self.sync_plugins()
+        except Exception as e:
+            logger.error(f"Plugin sync failed: {e}")
+    
+    def schedule(self, callback, interval: float, delay: float = 0.0, blocking: bool = False):
+        """
+        Run callback every `interval` seconds on the scheduler thread.
+        Pass blocking=True for tasks that may run long (downloads, syncs):
+        they run on the worker pool so they don't hold up the heartbeat.
+        """
+        if blocking:
+            self._blocking_tasks.add(callback)
+        deadline = time.monotonic() + delay
+        with self._tasks_lock:
+            heapq.heappush(self._tasks, (deadline, next(self._task_seq), interval, callback))
+        self._wake.set()
+    
+    def run_soon(self, callback):
+        """Move a scheduled callback's next run to now"""
+        now = time.monotonic()
+        with self._tasks_lock:
+            self._tasks = [
+                (now, seq, interval, cb) if cb == callback else (deadline, seq, interval, cb)
+                for deadline, seq, interval, cb in self._tasks
+            ]
+            heapq.heapify(self._tasks)
+        self._wake.set()
+    
+    def scheduler_loop(self):
+        """Single timer thread for heartbeat, polling, plugin sync and update checks"""
         while self.running:
-            time.sleep(interval)
+            self._wake.clear()
+            with self._tasks_lock:
+                if self._tasks:
+                    deadline, seq, interval, callback = self._tasks[0]
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        heapq.heappop(self._tasks)
+                else:
+                    timeout = None
             
-            try:
-                self.sync_plugins()
-            except Exception as e:
-                logger.error(f"Plugin sync failed: {e}")
+            if timeout is None or timeout > 0:
+                self._wake.wait(timeout)
+                continue
+            
+            # A blocking task is off the heap until it finishes, so it never overlaps itself
+            if callback in self._blocking_tasks:
+                self._exec_pool.submit(self._run_task, deadline, seq, interval, callback)
+            else:
+                self._run_task(deadline, seq, interval, callback)
     
-    def auto_update_loop(self):
-        """Automatic update check loop"""
-        if not self.config.get('updates.auto_update', False):
-            logger.info("Auto-update is disabled")
-            return
+    def _run_task(self, deadline: float, seq: int, interval: float, callback):
+        """Run one scheduled task and queue its next run"""
+        # A callback may return the delay until its next run. One failing
+        # task must not take the others (and the scheduler) down with it
+        try:
+            next_delay = callback()
+        except Exception as e:
+            logger.error(f"Scheduled task {callback.__name__} failed: {e}")
+            next_delay = None
+        # Re-read: a config reload may have landed while the callback ran
+        interval = self._task_intervals.get(callback, interval)
+        if next_delay is None:
+            next_delay = interval
         
-        interval = self.config.get('updates.check_interval', 3600)  # Default 1 hour
-        update_url = self.config.get('updates.update_url', '')
+        # Keep a fixed cadence; after an overrun, start a fresh period from now
+        # instead of firing again immediately to catch up
+        deadline += next_delay
+        now = time.monotonic()
+        if deadline < now:
+            deadline = now + next_delay
+        with self._tasks_lock:
+            heapq.heappush(self._tasks, (deadline, seq, interval, callback))
+        self._wake.set()
+    
+    def stop(self):
+        """Stop the agent loops and close the WebSocket"""
+        self.running = False
+        self._stop_event.set()
+        self._wake.set()
+        if self.ws:
+            self.ws.close()
+    
+    def check_for_updates(self) -> Optional[float]:
+        """
+        Automatic update check (scheduled every updates.check_interval).
+        After a failed update the next check is pushed out with jittered
+        exponential backoff instead of retrying at the regular interval.
+        """
+        if self._update_applied:
+            return None  # Agent is restarting into the new version
         
-        logger.info(f"Auto-update enabled, checking every {interval}s")
+        update_url = self._update_url
+        result = None
         
-        while self.running:
-            time.sleep(interval)
+        try:
+            logger.info("🔍 Checking for updates...")
             
-            try:
-                logger.info("🔍 Checking for updates...")
+            if update_url:
+                # Check if URL has newer version (by downloading and comparing)
+                result = self.self_update(update_url=update_url)
+            else:
+                # Check server for updates
+                update_info = self.graphql.get_agent_update()
                 
-                if update_url:
-                    # Check if URL has newer version (by downloading and comparing)
-                    result = self.self_update(update_url=update_url)
+                if update_info and update_info.get('version') != self.version:
+                    logger.info(
+                        f"Update available: {self.version} -> "
+                        f"{update_info.get('version')}"
+                    )
+                    result = self.self_update()
                 else:
-                    # Check server for updates
-                    update_info = self.graphql.get_agent_update()
-                    
-                    if update_info and update_info.get('version') != self.version:
-                        logger.info(
-                            f"Update available: {self.version} -> "
-                            f"{update_info.get('version')}"
-                        )
-                        result = self.self_update()
-                    else:
-                        logger.info(f"No updates available (current: {self.version})")
-                        continue
+                    logger.info(f"No updates available (current: {self.version})")
+                    result = {"success": True}
+            
+            if result.get('success') and result.get('restarting'):
+                logger.info("Update applied, agent will restart...")
+                self._update_applied = True
                 
-                if result.get('success') and result.get('restarting'):
-                    logger.info("Update applied, agent will restart...")
-                    break  # Exit loop as agent is restarting
-                    
-            except Exception as e:
-                logger.error(f"Auto-update check failed: {e}")
+        except Exception as e:
+            logger.error(f"Auto-update check failed: {e}")
+        
+        interval = self._update_interval
+        if result and result.get('success'):
+            self._update_retry_delay = interval
+            return interval
+        
+        # Decorrelated jitter: keeps a fleet from retrying a broken server in lockstep
+        self._update_retry_delay = random.uniform(
+            interval, min(self._update_retry_delay * 3, MAX_UPDATE_BACKOFF)
+        )
+        logger.info(f"Next update check in {int(self._update_retry_delay)}s")
+        return self._update_retry_delay
     
     def on_ws_message(self, ws, message):
         """WebSocket message handler"""
         try:
-            data = json.loads(message)
-            msg_type = data.get('type')
-            
-            if msg_type == 'new_command':
-                # New command received via WebSocket
-                cmd = data.get('command')
-                self.execute_command(cmd)
-            
-            elif msg_type == 'sync_plugins':
-                # Plugin update notification
-                self.sync_plugins()
-            
-            elif msg_type == 'ping':
-                # Server ping
-                ws.send(json.dumps({"type": "pong"}))
-                
+            data = _json_loads(message)
+            handler = self._ws_handlers.get(data.get('type'))
+            if handler:
+                handler(ws, data)
         except Exception as e:
             logger.error(f"WebSocket message error: {e}")
     
+    # Commands and plugin syncs can run for tens of seconds; they go to the
+    # pool so the dispatcher thread keeps reading frames (and pongs) meanwhile
+    
+    def _on_ws_new_command(self, ws, data):
+        """New command received via WebSocket"""
+        cmd = data.get('command')
+        if cmd:
+            self.submit_command(cmd)
+    
+    def _on_ws_sync_plugins(self, ws, data):
+        """Plugin update notification"""
+        self._exec_pool.submit(self._run_logged, self.sync_plugins)
+    
+    @staticmethod
+    def _run_logged(func, *args):
+        """Run func on the pool, logging errors nobody would collect otherwise"""
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"{func.__name__} failed: {e}")
+    
+    def _on_ws_ping(self, ws, data):
+        """Server ping"""
+        ws.send(_WS_PONG)
+    
     def on_ws_error(self, ws, error):
         """WebSocket error handler"""
         logger.error(f"WebSocket error: {error}")
-        self.ws_connected = False
+        self._on_ws_disconnected()
     
     def on_ws_close(self, ws, close_status_code, close_msg):
         """WebSocket close handler"""
         logger.warning(f"WebSocket closed: {close_status_code} - {close_msg}")
+        self._on_ws_disconnected()
+    
+    def _on_ws_disconnected(self):
+        """Switch to fallback polling right away instead of at the next slot"""
+        was_connected = self.ws_connected
         self.ws_connected = False
-        
-        # Reconnect after delay
-        time.sleep(5)
-        if self.running:
-            self.start_websocket()
+        if was_connected:
+            self._poll_backoff = 1
+            self.run_soon(self.poll_if_disconnected)
     
     def on_ws_open(self, ws):
         """WebSocket open handler"""
         logger.info("✅ WebSocket connected")
         self.ws_connected = True
+        self._reconnect_delay = 1
         
-        # Check for missed commands
-        try:
-            self.poll_commands()
-        except Exception as e:
-            logger.error(f"Failed to check missed commands: {e}")
+        # Check for missed commands off the dispatcher thread, which must
+        # get back to reading frames
+        self._exec_pool.submit(self._run_logged, self.poll_commands)
     
     def start_websocket(self):
-        """Start WebSocket connection"""
-        ws_url = self.config.get('server.ws_url')
-        url = f"{ws_url}?agentId={self.agent_id}"
-        
-        logger.info(f"Connecting to WebSocket: {url}")
-        
-        self.ws = websocket.WebSocketApp(
-            url,
-            on_message=self.on_ws_message,
-            on_error=self.on_ws_error,
-            on_close=self.on_ws_close,
-            on_open=self.on_ws_open
-        )
-        
-        # Run in thread
-        ws_thread = threading.Thread(
-            target=self.ws.run_forever,
-            daemon=True
-        )
-        ws_thread.start()
+        """Start the WebSocket thread"""
+        threading.Thread(target=self.websocket_loop, name="ws", daemon=True).start()
+    
+    def websocket_loop(self):
+        """Keep one WebSocket connected, reconnecting on the same thread"""
+        while self.running:
+            url = f"{self._ws_url}?agentId={self.agent_id}"
+            logger.info(f"Connecting to WebSocket: {url}")
+            
+            self.ws = websocket.WebSocketApp(
+                url,
+                on_message=self.on_ws_message,
+                on_error=self.on_ws_error,
+                on_close=self.on_ws_close,
+                on_open=self.on_ws_open
+            )
+            
+            # Protocol-level pings detect dead connections without a server
+            # round-trip through on_ws_message; UTF-8 validation of text
+            # frames is skipped since payloads are parsed as JSON anyway.
+            self.ws.run_forever(
+                ping_interval=20,
+                ping_timeout=10,
+                skip_utf8_validation=True,
+            )
+            self._on_ws_disconnected()
+            if not self.running:
+                break
+            
+            # Reconnect with decorrelated jitter so agents don't reconnect in lockstep
+            delay = random.uniform(1, min(self._reconnect_delay * 3, MAX_RECONNECT_DELAY))
+            self._reconnect_delay = delay
+            logger.info(f"Reconnecting WebSocket in {delay:.1f}s")
+            if self._stop_event.wait(delay):
+                break
     
     def start(self):
         """Start agent"""
@@ -1005,24 +1618,33 @@ class Agent:
         except Exception as e:
             logger.error(f"Initial plugin sync failed: {e}")
         
-        # Start background threads
-        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
-        threading.Thread(target=self.polling_loop, daemon=True).start()
-        threading.Thread(target=self.plugin_sync_loop, daemon=True).start()
-        threading.Thread(target=self.auto_update_loop, daemon=True).start()
+        # Periodic tasks share one scheduler thread; slow ones run on the pool
+        self.schedule(self.send_heartbeat, self._heartbeat_interval)
+        self.schedule(self.poll_if_disconnected, self._poll_interval)
+        if self._plugin_auto_sync:
+            interval = self._plugin_sync_interval
+            self.schedule(self.periodic_plugin_sync, interval, delay=interval, blocking=True)
+        if self._auto_update:
+            interval = self._update_interval
+            logger.info(f"Auto-update enabled, checking every {interval}s")
+            self.schedule(self.check_for_updates, interval, delay=interval, blocking=True)
+        else:
+            logger.info("Auto-update is disabled")
+        threading.Thread(target=self.scheduler_loop, daemon=True).start()
+        
+        # `kill -HUP <pid>` re-reads config.yaml without a restart
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.reload_config)
         
         # Start WebSocket
         self.start_websocket()
         
         # Main loop
         try:
-            while self.running:
-                time.sleep(1)
+            self._stop_event.wait()
         except KeyboardInterrupt:
             logger.info("Shutting down...")
-            self.running = False
-            if self.ws:
-                self.ws.close()
+            self.stop()
 
 
 def main():
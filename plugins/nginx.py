@@ -4,80 +4,125 @@ Nginx management plugin
 
 import subprocess
 import logging
+import time
 
 logger = logging.getLogger('Plugin.Nginx')
 
+# Don't let restart/reload/test of the same service interleave
+REENTRANT = False
+
+STATUS_CACHE_TTL = 0.5  # seconds; rapid status polls reuse the last result
+
+# service -> (time.monotonic(), status result)
+_status_cache = {}
+
+
+def _run(cmd, timeout):
+    return subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        timeout=timeout
+    )
+
+
+def _restart(service):
+    result = _run(['systemctl', 'restart', service], 30)
+    _status_cache.pop(service, None)
+    return {
+        "action": "restart",
+        "success": result.returncode == 0,
+        "output": result.stdout,
+        "error": result.stderr
+    }
+
+
+def _status(service):
+    now = time.monotonic()
+    cached = _status_cache.get(service)
+    if cached and now - cached[0] < STATUS_CACHE_TTL:
+        # Copy: the agent adds "success" to the dict it gets back
+        return dict(cached[1])
+
+    result = _run(['systemctl', 'status', service], 10)
+    status = {
+        "action": "status",
+        "running": result.returncode == 0,
+        "output": result.stdout
+    }
+    _status_cache[service] = (now, status)
+    return dict(status)
+
+
+def _reload(service):
+    result = _run(['systemctl', 'reload', service], 30)
+    _status_cache.pop(service, None)
+    return {
+        "action": "reload",
+        "success": result.returncode == 0
+    }
+
+
+def _test(service):
+    result = _run(['nginx', '-t'], 10)
+    return {
+        "action": "test",
+        "valid": result.returncode == 0,
+        "output": result.stdout + result.stderr
+    }
+
+
+def _test_and_reload(service):
+    """Validate the config and reload only if it is valid"""
+    test = _test(service)
+    if not test["valid"]:
+        return {
+            "action": "test_and_reload",
+            "success": False,
+            "valid": False,
+            "reloaded": False,
+            "output": test["output"]
+        }
+    reload = _reload(service)
+    return {
+        "action": "test_and_reload",
+        "success": reload["success"],
+        "valid": True,
+        "reloaded": reload["success"],
+        "output": test["output"]
+    }
+
+
+_ACTIONS = {
+    'restart': _restart,
+    'status': _status,
+    'reload': _reload,
+    'test': _test,
+    'test_and_reload': _test_and_reload,
+}
+
+
 def handle(args):
     """
     Handle nginx commands
-    
+
     Args:
         args: {
-            "action": "restart" | "status" | "reload" | "test",
+            "action": "restart" | "status" | "reload" | "test" | "test_and_reload",
             "service": "nginx"  # optional
         }
     """
     action = args.get('action')
     service = args.get('service', 'nginx')
-    
+
     logger.info(f"Nginx action: {action}")
-    
+
+    handler = _ACTIONS.get(action)
+    if handler is None:
+        return {"error": f"Unknown action: {action}"}
+
     try:
-        if action == 'restart':
-            result = subprocess.run(
-                ['systemctl', 'restart', service],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            return {
-                "action": "restart",
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr
-            }
-        
-        elif action == 'status':
-            result = subprocess.run(
-                ['systemctl', 'status', service],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            return {
-                "action": "status",
-                "running": result.returncode == 0,
-                "output": result.stdout
-            }
-        
-        elif action == 'reload':
-            result = subprocess.run(
-                ['systemctl', 'reload', service],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            return {
-                "action": "reload",
-                "success": result.returncode == 0
-            }
-        
-        elif action == 'test':
-            result = subprocess.run(
-                ['nginx', '-t'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            return {
-                "action": "test",
-                "valid": result.returncode == 0,
-                "output": result.stdout + result.stderr
-            }
-        
-        else:
-            return {"error": f"Unknown action: {action}"}
-            
+        return handler(service)
     except subprocess.TimeoutExpired:
         return {"error": "Command timeout"}
     except Exception as e:
@@ -2,11 +2,100 @@
 Shell command plugin - Execute shell scripts/commands on the agent
 """
 
-import subprocess
+import os
+import re
+import time
+import shlex
 import logging
+import selectors
+import subprocess
+from collections import deque
 
 logger = logging.getLogger("Plugin.Shell")
 
+PIPE_BUFSIZE = 65536
+DEFAULT_MAX_OUTPUT_BYTES = 1024 * 1024  # keep at most the last 1 MiB per stream
+
+# Anything that needs /bin/sh to interpret it
+_SHELL_META_RE = re.compile(r'[;&|<>$`\\"\'*?(){}\[\]~!#\n]')
+# Commands that only exist (or only behave correctly) inside a shell
+_SHELL_BUILTINS = frozenset({
+    ".", "alias", "cd", "command", "eval", "exec", "exit", "export", "read",
+    "set", "source", "trap", "type", "ulimit", "umask", "unset", "wait",
+})
+
+
+def _direct_argv(script):
+    """argv to exec without a shell, or None if the script needs /bin/sh."""
+    if isinstance(script, (list, tuple)):
+        return [str(a) for a in script]
+    if _SHELL_META_RE.search(script):
+        return None
+    argv = shlex.split(script)
+    if not argv or argv[0] in _SHELL_BUILTINS or "=" in argv[0]:
+        return None
+    return argv
+
+
+class _TailBuffer:
+    """Keeps only the last `limit` bytes written to it."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._chunks = deque()
+
+    def write(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+        self.size += len(chunk)
+        while len(self._chunks) > 1 and self.size - len(self._chunks[0]) >= self.limit:
+            self.size -= len(self._chunks.popleft())
+            self.truncated = True
+
+    def text(self) -> str:
+        data = b"".join(self._chunks)
+        if len(data) > self.limit:
+            data = data[-self.limit:]
+            self.truncated = True
+        return data.decode("utf-8", errors="replace")
+
+
+def _communicate_tail(proc: subprocess.Popen, timeout: float, max_bytes: int):
+    """
+    Read stdout/stderr until EOF, keeping only the last max_bytes of each.
+    Raises subprocess.TimeoutExpired (after killing the child) on timeout;
+    timeout=None waits indefinitely.
+    """
+    buffers = {proc.stdout: _TailBuffer(max_bytes), proc.stderr: _TailBuffer(max_bytes)}
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining():
+        return None if deadline is None else deadline - time.monotonic()
+
+    try:
+        with selectors.DefaultSelector() as sel:
+            for pipe in buffers:
+                sel.register(pipe, selectors.EVENT_READ)
+            while sel.get_map():
+                left = remaining()
+                if left is not None and left <= 0:
+                    raise subprocess.TimeoutExpired(proc.args, timeout)
+                for key, _ in sel.select(left):
+                    chunk = os.read(key.fd, PIPE_BUFSIZE)
+                    if chunk:
+                        buffers[key.fileobj].write(chunk)
+                    else:
+                        sel.unregister(key.fileobj)
+
+        left = remaining()
+        proc.wait(timeout=None if left is None else max(0, left))
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    return buffers[proc.stdout], buffers[proc.stderr]
+
 
 def handle(args: dict) -> dict:
     """
@@ -14,52 +103,74 @@ def handle(args: dict) -> dict:
 
     Args:
         args: {
-          "script": "echo hello",   # Required: command to execute
-          "timeout": 30,            # Optional: timeout in seconds (default: 30)
-          "cwd": "/tmp"             # Optional: working directory
+          "script": "echo hello",       # Required: command string or argv list
+          "timeout": 30,                # Optional: timeout in seconds (default: 30, None: no limit)
+          "cwd": "/tmp",                # Optional: working directory
+          "max_output_bytes": 1048576   # Optional: keep only the tail of stdout/stderr
         }
-    
+
     Returns:
-        dict with success, exit_code, stdout, stderr
+        dict with success, exit_code, stdout, stderr (and truncated=True when
+        output exceeded max_output_bytes)
     """
     script = args.get("script")
     timeout = args.get("timeout", 30)
     cwd = args.get("cwd")
+    max_output_bytes = args.get("max_output_bytes", DEFAULT_MAX_OUTPUT_BYTES)
 
     if not script:
         return {"success": False, "error": "Missing 'script' argument"}
+    if isinstance(max_output_bytes, bool) or not isinstance(max_output_bytes, int) or max_output_bytes <= 0:
+        return {"success": False, "error": "'max_output_bytes' must be a positive integer"}
 
     logger.info("Executing shell script: %s (timeout: %ss)", script, timeout)
 
     try:
-        result = subprocess.run(
-            script,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            cwd=cwd,
-        )
-        
+        # Simple commands are exec'd directly, saving the /bin/sh fork+exec;
+        # fall back to the shell if the program can't be found that way
+        argv = _direct_argv(script)
+        popen_args = {
+            "stdout": subprocess.PIPE,
+            "stderr": subprocess.PIPE,
+            "bufsize": PIPE_BUFSIZE,
+            "cwd": cwd,
+        }
+        try:
+            if argv is None:
+                raise FileNotFoundError
+            proc = subprocess.Popen(argv, **popen_args)
+        except (FileNotFoundError, PermissionError):
+            if isinstance(script, (list, tuple)):
+                raise
+            # Buffered pipes; no preexec_fn so CPython can take its vfork/posix_spawn path
+            proc = subprocess.Popen(script, shell=True, **popen_args)
+
+        with proc:
+            out_buf, err_buf = _communicate_tail(proc, timeout, max_output_bytes)
+            returncode = proc.returncode
+
+        stdout = out_buf.text()
+        stderr = err_buf.text()
         output = {
-            "success": result.returncode == 0,
-            "exit_code": result.returncode,
-            "stdout": result.stdout.strip() if result.stdout else "",
-            "stderr": result.stderr.strip() if result.stderr else "",
+            "success": returncode == 0,
+            "exit_code": returncode,
+            "stdout": stdout.strip(),
+            "stderr": stderr.strip(),
         }
-        
-        logger.info("Script completed with exit code: %d", result.returncode)
-        if result.stdout:
-            logger.info("stdout: %s", result.stdout[:200])
-        if result.stderr:
-            logger.warning("stderr: %s", result.stderr[:200])
-            
+        if out_buf.truncated or err_buf.truncated:
+            output["truncated"] = True
+
+        logger.info("Script completed with exit code: %d", returncode)
+        if stdout:
+            logger.info("stdout: %s", stdout[:200])
+        if stderr:
+            logger.warning("stderr: %s", stderr[:200])
+
         return output
-        
+
     except subprocess.TimeoutExpired:
         logger.error("Script timed out after %ss", timeout)
         return {"success": False, "error": f"Command timed out after {timeout}s"}
     except Exception as exc:
         logger.error("Script execution failed: %s", exc)
         return {"success": False, "error": str(exc)}
-
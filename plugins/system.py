@@ -8,109 +8,311 @@ System Plugin - System info and user management.
 """
 
 import os
+import re
 import platform
+import signal
+import selectors
 import logging
+import functools
 import subprocess
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import psutil
 
 logger = logging.getLogger("Plugin.System")
 
+# User management mutates the local directory; have the agent run one call at a time
+REENTRANT = False
+
+# Invariant after boot - read once at import instead of on every request
+_CPU_COUNT = psutil.cpu_count()
+_BOOT_TIME = psutil.boot_time()
+_PLATFORM_INFO = {
+    "platform": platform.system(),
+    "release": platform.release(),
+    "version": platform.version(),
+    "machine": platform.machine(),
+    "hostname": platform.node(),
+}
+
+# Prime the CPU counters so cpu_percent(interval=None) reports usage since
+# the previous call instead of blocking for a sampling interval
+psutil.cpu_percent(interval=None)
+
+DISK_USAGE_TTL = 5.0  # seconds
+SYSINFO_CACHE_TTL = 2.0  # seconds; info=all is rebuilt at most this often
+INFO_MIN_INTERVAL = 1.0  # seconds; single-section requests (info=cpu, ...)
+USERS_CACHE_TTL = 2.0  # seconds; shared by user_exists/list_users/delete_user
+
+# Last `dscl . -list /Users` snapshot
+_USERS_CACHE = {"ts": 0.0, "users": frozenset()}
+
+# Default concurrency for bulk actions (override with args['workers']).
+# Creation stays sequential: concurrent `sysadminctl -addUser` calls each
+# pick "the next free UID" independently and can collide.
+BULK_CREATE_WORKERS = 1
+BULK_DELETE_WORKERS = 4
+
 SUDO_HINT = (
     " User management requires root. Either run the agent as root "
-    "(e.g. sudo python agent.py) or configure passwordless sudo for sysadminctl."
+    "(e.g. sudo python agent.py) or configure passwordless sudo for /usr/sbin/sysadminctl."
 )
 
+# sysadminctl stderr classification (one regex scan instead of several `in` checks)
+_CRITICAL_ERR_RE = re.compile(r"Authentication failed|Permission denied|command not found|Invalid user")
+_CREATE_SUDO_TRIGGERS_RE = re.compile(r"password|terminal")
+_SUDO_TRIGGERS_RE = re.compile(r"password|terminal|Authentication")
+_SECURE_TOKEN_ERR = "14120"  # eDSPermissionError: user has a Secure Token
+
+
+# The effective uid doesn't change after start, so decide on sudo once
+_IS_ROOT = os.geteuid() == 0 if hasattr(os, "geteuid") else False
+_SUDO_PREFIX = () if _IS_ROOT else ("/usr/bin/sudo",)
+
+# Absolute paths skip the PATH search and let subprocess take its
+# posix_spawn fast path instead of fork+exec
+_DSCL = "/usr/bin/dscl"
+_SYSADMINCTL = "/usr/sbin/sysadminctl"
+_RM = "/bin/rm"
+
+
+def _ttl_cache(seconds):
+    """Memoize a function per positional args for `seconds`."""
+    def decorator(func):
+        cache = {}
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            hit = cache.get(args)
+            if hit is not None and now - hit[0] < seconds:
+                return hit[1]
+            value = func(*args)
+            cache[args] = (now, value)
+            return value
+        return wrapper
+    return decorator
+
+
+@_ttl_cache(DISK_USAGE_TTL)
+def _disk_usage(path):
+    return psutil.disk_usage(path)
 
-def _is_root():
-    """True if process has root privileges (no sudo needed)."""
+
+def _fast_capture(argv, timeout):
+    """
+    Run a short-lived command and capture its output, like
+    subprocess.run(argv, capture_output=True, text=True, timeout=timeout).
+    Spawns with os.posix_spawnp directly, skipping Popen's fork machinery;
+    falls back to _run() where posix_spawnp isn't available.
+    """
+    if not hasattr(os, "posix_spawnp"):
+        return _run(argv, timeout)
+
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    try:
+        pid = os.posix_spawnp(
+            argv[0],
+            argv,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, out_w, 1),
+                (os.POSIX_SPAWN_DUP2, err_w, 2),
+            ],
+        )
+    except BaseException:
+        for fd in (out_r, out_w, err_r, err_w):
+            os.close(fd)
+        raise
+    os.close(out_w)
+    os.close(err_w)
+
+    chunks = {out_r: [], err_r: []}
+    deadline = time.monotonic() + timeout
+    try:
+        # selectors (poll/kqueue), unlike select.select, has no FD_SETSIZE limit
+        with selectors.DefaultSelector() as sel:
+            for fd in chunks:
+                sel.register(fd, selectors.EVENT_READ)
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    os.kill(pid, signal.SIGKILL)
+                    os.waitpid(pid, 0)
+                    raise subprocess.TimeoutExpired(argv, timeout)
+                for key, _ in sel.select(remaining):
+                    data = os.read(key.fd, 65536)
+                    if data:
+                        chunks[key.fd].append(data)
+                    else:
+                        sel.unregister(key.fd)
+        _, status = os.waitpid(pid, 0)
+    finally:
+        os.close(out_r)
+        os.close(err_r)
+
+    return subprocess.CompletedProcess(
+        argv,
+        os.waitstatus_to_exitcode(status),
+        b"".join(chunks[out_r]).decode("utf-8", errors="replace"),
+        b"".join(chunks[err_r]).decode("utf-8", errors="replace"),
+    )
+
+
+def _dscl_list_users(max_age=USERS_CACHE_TTL):
+    """Set of Directory Service user names, re-read when older than max_age seconds."""
+    now = time.monotonic()
+    if _USERS_CACHE["ts"] and now - _USERS_CACHE["ts"] < max_age:
+        return _USERS_CACHE["users"]
+    result = _fast_capture([_DSCL, ".", "-list", "/Users"], timeout=10)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr or "dscl -list /Users failed")
+    # One name per line and short names can't contain whitespace, so a single
+    # str.split() both splits lines and drops blanks/stray \r
+    users = frozenset(result.stdout.split())
+    _USERS_CACHE["ts"] = time.monotonic()
+    _USERS_CACHE["users"] = users
+    return users
+
+
+def _invalidate_users_cache():
+    _USERS_CACHE["ts"] = 0.0
+
+
+def _path_missing(path):
+    """True if nothing exists at path (a single lstat; dangling symlinks count as present)."""
     try:
-        return os.geteuid() == 0
-    except AttributeError:
+        os.lstat(path)
         return False
+    except FileNotFoundError:
+        return True
+
+
+def _run(cmd, timeout):
+    """
+    subprocess.run with captured text output. close_fds=False is safe here:
+    Python creates descriptors non-inheritable (PEP 446), so children still
+    only get stdin/stdout/stderr, and it avoids walking the fd table.
+    """
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout, close_fds=False)
 
 
 def _root_cmd(*args):
     """Prefix with sudo when not running as root."""
-    return ([] if _is_root() else ["sudo"]) + list(args)
+    return [*_SUDO_PREFIX, *args]
 
 
 def handle(args):
     """
     Handle system commands.
 
-    System info (args['info']): "all" | "cpu" | "memory" | "disk" | "network"
+    System info (args['info']): "all" | "cpu" | "memory" | "disk" | "network",
+      or a list of sections (may include "system")
     User management (args['action']): create_user | delete_user | list_users | user_exists
+      | bulk_create_users | bulk_delete_users
     """
     action = args.get("action")
-    if action == "create_user":
-        return _create_user(args)
-    if action == "delete_user":
-        return _delete_user(args)
-    if action == "list_users":
-        return _list_users(args)
-    if action == "user_exists":
-        return _user_exists(args)
-    if action is not None:
+    if action is None:
+        return _system_info(args)
+    handler = _ACTIONS.get(action)
+    if handler is None:
         return {
             "success": False,
             "error": f"Unknown action: {action}",
-            "supported_actions": [
-                "create_user",
-                "delete_user",
-                "list_users",
-                "user_exists",
-            ],
+            "supported_actions": list(_ACTIONS),
         }
-    return _system_info(args)
+    return handler(args)
+
+
+def _cpu_info():
+    return {
+        "percent": psutil.cpu_percent(interval=None),
+        "count": _CPU_COUNT,
+        "load_avg": os.getloadavg() if hasattr(os, "getloadavg") else None,
+    }
+
+
+def _memory_info():
+    mem = psutil.virtual_memory()
+    return {
+        "total": mem.total,
+        "available": mem.available,
+        "percent": mem.percent,
+        "used": mem.used,
+    }
+
+
+def _disk_info():
+    disk = _disk_usage("/")
+    return {
+        "total": disk.total,
+        "used": disk.used,
+        "free": disk.free,
+        "percent": disk.percent,
+    }
+
+
+def _network_info():
+    net = psutil.net_io_counters()
+    return {
+        "bytes_sent": net.bytes_sent,
+        "bytes_recv": net.bytes_recv,
+        "packets_sent": net.packets_sent,
+        "packets_recv": net.packets_recv,
+    }
+
+
+def _platform_info():
+    return {
+        **_PLATFORM_INFO,
+        "uptime": time.time() - _BOOT_TIME,
+    }
+
+
+# info type -> section builder; "all" collects every section in one pass
+_INFO_SECTIONS = {
+    "cpu": _cpu_info,
+    "memory": _memory_info,
+    "disk": _disk_info,
+    "network": _network_info,
+    "system": _platform_info,
+}
+# "system" is only reported as part of "all"
+_SINGLE_INFO_TYPES = ("cpu", "memory", "disk", "network")
+
+
+@_ttl_cache(SYSINFO_CACHE_TTL)
+def _all_system_info():
+    return {name: build() for name, build in _INFO_SECTIONS.items()}
+
+
+@_ttl_cache(INFO_MIN_INTERVAL)
+def _info_section(name):
+    return {name: _INFO_SECTIONS[name]()}
 
 
 def _system_info(args):
-    """Get system information (cpu, memory, disk, network)."""
+    """Get system information (cpu, memory, disk, network).
+
+    info may also be a list of sections (e.g. ["cpu", "memory"]) so callers
+    only pay for what they use; there "system" may be requested too.
+    """
     info_type = args.get("info", "all")
-    result = {}
-    if info_type in ["all", "cpu"]:
-        result["cpu"] = {
-            "percent": psutil.cpu_percent(interval=1),
-            "count": psutil.cpu_count(),
-            "load_avg": os.getloadavg() if hasattr(os, "getloadavg") else None,
-        }
-    if info_type in ["all", "memory"]:
-        mem = psutil.virtual_memory()
-        result["memory"] = {
-            "total": mem.total,
-            "available": mem.available,
-            "percent": mem.percent,
-            "used": mem.used,
-        }
-    if info_type in ["all", "disk"]:
-        disk = psutil.disk_usage("/")
-        result["disk"] = {
-            "total": disk.total,
-            "used": disk.used,
-            "free": disk.free,
-            "percent": disk.percent,
-        }
-    if info_type in ["all", "network"]:
-        net = psutil.net_io_counters()
-        result["network"] = {
-            "bytes_sent": net.bytes_sent,
-            "bytes_recv": net.bytes_recv,
-            "packets_sent": net.packets_sent,
-            "packets_recv": net.packets_recv,
-        }
+    if isinstance(info_type, (list, tuple, set, frozenset)):
+        result = {}
+        for name in info_type:
+            if name in _INFO_SECTIONS:
+                result.update(_info_section(name))
+        return result
+    # Shallow copies: the agent adds "success" to the returned dict, which
+    # must not leak into the cached snapshot
     if info_type == "all":
-        result["system"] = {
-            "platform": platform.system(),
-            "release": platform.release(),
-            "version": platform.version(),
-            "machine": platform.machine(),
-            "hostname": platform.node(),
-            "uptime": datetime.now().timestamp() - psutil.boot_time(),
-        }
-    return result
+        return dict(_all_system_info())
+    if info_type in _SINGLE_INFO_TYPES:
+        return dict(_info_section(info_type))
+    return {}
 
 
 def _create_user(args):
@@ -123,12 +325,13 @@ def _create_user(args):
         return {"success": False, "error": "Missing username"}
     logger.info("Creating user: %s", username)
     try:
-        cmd = _root_cmd("sysadminctl", "-addUser", username, "-fullName", fullname)
+        cmd = _root_cmd(_SYSADMINCTL, "-addUser", username, "-fullName", fullname)
         if password:
             cmd.extend(["-password", password])
         if is_admin:
             cmd.append("-admin")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = _run(cmd, timeout=30)
+        _invalidate_users_cache()
         if result.returncode == 0:
             logger.info("User %s created successfully", username)
             return {
@@ -140,7 +343,7 @@ def _create_user(args):
             }
         logger.error("Failed to create user %s: %s", username, result.stderr)
         err = result.stderr or ""
-        hint = SUDO_HINT if ("password" in err or "terminal" in err) else ""
+        hint = SUDO_HINT if _CREATE_SUDO_TRIGGERS_RE.search(err) else ""
         return {
             "success": False,
             "error": f"Failed to create user: {result.stderr}{hint}",
@@ -158,24 +361,20 @@ def _create_user(args):
 def _secure_token_status(username):
     """Return True if user has Secure Token (can block full account deletion)."""
     try:
-        r = subprocess.run(
-            _root_cmd("sysadminctl", "-secureTokenStatus", username),
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
+        r = _fast_capture(_root_cmd(_SYSADMINCTL, "-secureTokenStatus", username), timeout=10)
         return "ENABLED" in (r.stdout or "") or "ENABLED" in (r.stderr or "")
     except Exception:
         return False
 
 
-def _delete_user(args):
+def _delete_user(args, known_users=None):
     """Delete a user account (macOS sysadminctl with optional secure deletion).
 
     If the user has a Secure Token (Error -14120), pass remove_secure_token=True and
     password=<user's password>. When the agent runs as root (no Secure Token), also
     pass admin_user and admin_password for an admin that has Secure Token so we can
     run secureTokenOff. force_dscl_fallback removes the DS record if sysadminctl didn't.
+    known_users is a fresh dscl listing supplied by bulk_delete_users to skip the pre-check.
     """
     username = args.get("username")
     secure = args.get("secure", True)  # Delete home directory by default
@@ -189,15 +388,10 @@ def _delete_user(args):
     logger.info("Deleting user: %s (secure=%s)", username, secure)
 
     try:
-        # First check if user exists
-        check_result = subprocess.run(
-            ["dscl", ".", "-list", "/Users"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
-
-        if username not in check_result.stdout.split("\n"):
+        # First check if user exists (fresh listing; also the verification baseline)
+        if known_users is None:
+            known_users = _dscl_list_users(max_age=0)
+        if username not in known_users:
             logger.warning("User %s does not exist", username)
             return {
                 "success": False,
@@ -212,12 +406,12 @@ def _delete_user(args):
             admin_user = args.get("admin_user")
             admin_password = args.get("admin_password")
             logger.info("Removing Secure Token for user %s", username)
-            base = _root_cmd("sysadminctl")
+            base = _root_cmd(_SYSADMINCTL)
             if admin_user and admin_password:
                 tok_cmd = base + ["-adminUser", admin_user, "-adminPassword", admin_password, "-secureTokenOff", username, "-password", user_password]
             else:
                 tok_cmd = base + ["-secureTokenOff", username, "-password", user_password]
-            tok_off = subprocess.run(tok_cmd, capture_output=True, text=True, timeout=30)
+            tok_off = _run(tok_cmd, timeout=30)
             if tok_off.returncode != 0:
                 err_msg = tok_off.stderr or tok_off.stdout or "Unknown error"
                 logger.warning("Could not remove Secure Token: %s", err_msg)
@@ -232,21 +426,17 @@ def _delete_user(args):
             time.sleep(1)
 
         # Use sysadminctl to delete user (modern macOS method)
-        cmd = _root_cmd("sysadminctl", "-deleteUser", username)
+        cmd = _root_cmd(_SYSADMINCTL, "-deleteUser", username)
         if secure:
             cmd.append("-secure")
 
         logger.info("Executing delete command: %s", " ".join(cmd))
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
+        result = _run(cmd, timeout=60)
 
         err = result.stderr or ""
-        if result.returncode != 0 or "Error:-14120" in err or "-14120" in err:
-            if "14120" in err:
+        secure_token_err = _SECURE_TOKEN_ERR in err
+        if result.returncode != 0 or secure_token_err:
+            if secure_token_err:
                 hint = (
                     " User has Secure Token; deletion failed (eDSPermissionError). Remove the token first: "
                     "call delete_user with remove_secure_token=true, password=<user's password>, and if the "
@@ -260,9 +450,8 @@ def _delete_user(args):
                     "stderr": result.stderr,
                     "returncode": result.returncode,
                 }
-            critical_errors = ["Authentication failed", "Permission denied", "command not found", "Invalid user"]
-            if result.returncode != 0 and any(e in err for e in critical_errors):
-                hint = SUDO_HINT if ("password" in err or "terminal" in err or "Authentication" in err) else ""
+            if result.returncode != 0 and _CRITICAL_ERR_RE.search(err):
+                hint = SUDO_HINT if _SUDO_TRIGGERS_RE.search(err) else ""
                 return {
                     "success": False,
                     "error": f"Failed to delete user: {result.stderr}{hint}",
@@ -279,49 +468,55 @@ def _delete_user(args):
         ]
         deletion_started = any(i in stderr_lower for i in deletion_success_indicators)
 
-        if deletion_started:
+        home_dir = f"/Users/{username}"
+        # sysadminctl succeeded, reported removing the record and the home is
+        # gone: trust it and skip re-listing every user to verify
+        trusted = (
+            result.returncode == 0
+            and "deleting record for" in stderr_lower
+            and _path_missing(home_dir)
+        )
+        if trusted:
+            _invalidate_users_cache()
+
+        if deletion_started and not trusted:
             logger.info("Deletion command executed, waiting for directory service to update...")
             time.sleep(2)
 
         max_retries = 3
         retry_delay = 1
         user_still_exists = False
-
-        for attempt in range(max_retries):
-            verify = subprocess.run(
-                ["dscl", ".", "-list", "/Users"],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
-            user_list = [u.strip() for u in verify.stdout.split("\n") if u.strip()]
-            user_still_exists = username in user_list
+        if trusted:
+            attempts = 0
+        elif result.returncode != 0:
+            # sysadminctl failed: the pre-check already showed the user, so go
+            # straight to the dscl fallback if it will run. Otherwise check
+            # once, since sysadminctl can remove the record and still fail
+            user_still_exists = True
+            attempts = 0 if force_dscl_fallback else 1
+        else:
+            attempts = max_retries
+
+        for attempt in range(attempts):
+            user_still_exists = username in _dscl_list_users(max_age=0)
             if not user_still_exists:
-                logger.info("User %s verified as deleted (attempt %d/%d)", username, attempt + 1, max_retries)
+                logger.info("User %s verified as deleted (attempt %d/%d)", username, attempt + 1, attempts)
                 break
-            if attempt < max_retries - 1:
+            if attempt < attempts - 1:
                 time.sleep(retry_delay)
+                retry_delay *= 2
 
         # If user still in Directory Service (still shows in Users & Groups), try dscl fallback
         if user_still_exists and force_dscl_fallback:
             logger.warning("User still in Directory Service after sysadminctl; removing record with dscl")
-            dscl_remove = subprocess.run(
-                _root_cmd("dscl", ".", "-delete", f"/Users/{username}"),
-                capture_output=True,
-                text=True,
-                timeout=15,
-            )
+            dscl_remove = _run(_root_cmd(_DSCL, ".", "-delete", f"/Users/{username}"), timeout=15)
             if dscl_remove.returncode == 0:
                 time.sleep(1)
-                final = subprocess.run(
-                    ["dscl", ".", "-list", "/Users"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10,
-                )
-                user_still_exists = username in (final.stdout or "").split("\n")
             else:
+                # Fails too when sysadminctl had already removed the record
+                # despite its exit code; the listing below settles it
                 logger.warning("dscl fallback failed: %s", dscl_remove.stderr)
+            user_still_exists = username in _dscl_list_users(max_age=0)
 
         if user_still_exists:
             hint = (
@@ -336,16 +531,10 @@ def _delete_user(args):
                 "stderr": result.stderr,
             }
 
-        home_dir = f"/Users/{username}"
-        home_exists = os.path.exists(home_dir)
+        home_exists = not _path_missing(home_dir)
         if secure and home_exists:
             logger.warning("Home directory still exists at %s, attempting manual cleanup", home_dir)
-            rm_result = subprocess.run(
-                _root_cmd("rm", "-rf", home_dir),
-                capture_output=True,
-                text=True,
-                timeout=60,
-            )
+            rm_result = _run(_root_cmd(_RM, "-rf", home_dir), timeout=60)
             if rm_result.returncode == 0:
                 home_exists = False
             else:
@@ -370,22 +559,67 @@ def _delete_user(args):
         return {"success": False, "error": str(e)}
 
 
+def _bulk_params(args, default_workers):
+    """Validate bulk args: (users, workers, None) or (None, None, error result)."""
+    users = args.get("users")
+    if not isinstance(users, list) or not users:
+        return None, None, {"success": False, "error": "Missing or empty 'users' list"}
+    workers = args.get("workers", default_workers)
+    if isinstance(workers, bool) or not isinstance(workers, int) or workers < 1:
+        return None, None, {"success": False, "error": "'workers' must be a positive integer"}
+    return users, min(workers, len(users)), None
+
+
+def _run_bulk(func, users, workers):
+    """Run func over users concurrently; every entry yields its own result."""
+    def run_one(user_args):
+        if not isinstance(user_args, dict):
+            return {"success": False, "error": f"User entry must be an object, got {type(user_args).__name__}"}
+        try:
+            return func(user_args)
+        except Exception as e:
+            return {"success": False, "username": user_args.get("username"), "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-user") as pool:
+        results = list(pool.map(run_one, users))
+
+    errors = [r for r in results if not r.get("success")]
+    return {
+        "success": not errors,
+        "results": results,
+        "errors": errors,
+        "count": len(results),
+        "failed": len(errors),
+    }
+
+
+def _bulk_create_users(args):
+    """Create several users: args['users'] is a list of create_user args."""
+    users, workers, error = _bulk_params(args, BULK_CREATE_WORKERS)
+    if error:
+        return error
+    return _run_bulk(_create_user, users, workers)
+
+
+def _bulk_delete_users(args):
+    """Delete several users: args['users'] is a list of delete_user args."""
+    users, workers, error = _bulk_params(args, BULK_DELETE_WORKERS)
+    if error:
+        return error
+    try:
+        # One listing for the whole batch instead of a pre-check per user
+        known_users = _dscl_list_users(max_age=0)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    return _run_bulk(lambda user_args: _delete_user(user_args, known_users), users, workers)
+
+
 def _list_users(args):
     """List all user accounts (excluding system users)."""
     try:
-        result = subprocess.run(
-            ["dscl", ".", "-list", "/Users"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
-        if result.returncode != 0:
-            return {"success": False, "error": result.stderr}
-        users = [
-            line.strip()
-            for line in result.stdout.strip().split("\n")
-            if line.strip() and not line.strip().startswith("_")
-        ]
+        # Local node only (dscl .), like delete_user: pwd.getpwall() would also
+        # return network (AD/LDAP) accounts on a directory-bound Mac
+        users = sorted(u for u in _dscl_list_users() if not u.startswith("_"))
         return {"success": True, "users": users, "count": len(users)}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -397,20 +631,23 @@ def _user_exists(args):
     if not username:
         return {"success": False, "error": "Missing username"}
     try:
-        result = subprocess.run(
-            ["dscl", ".", "-list", "/Users"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-        )
-        if result.returncode != 0:
-            return {"success": False, "error": result.stderr}
-        exists = username in result.stdout.split("\n")
+        # Same local-node listing delete_user checks against
+        exists = username in _dscl_list_users()
         return {"success": True, "username": username, "exists": exists}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+_ACTIONS = {
+    "create_user": _create_user,
+    "delete_user": _delete_user,
+    "list_users": _list_users,
+    "user_exists": _user_exists,
+    "bulk_create_users": _bulk_create_users,
+    "bulk_delete_users": _bulk_delete_users,
+}
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     print("user_exists:", handle({"action": "user_exists", "username": "testuser"}))